@@ -0,0 +1,192 @@
+from typing import *
+from cps import *
+from cps import CpsConfiguration, CpsConstraintHandle, CpsState
+from bt_search import *
+from bt_search import BtSearch, BtSearchLimits, BtSearchStatus, BtSearchTools, BtTranspositionTable
+
+TVar = TypeVar('TVar')
+TVal = TypeVar('TVal')
+
+
+class IncrementalBtSearch(Generic[TVar, TVal]):
+    """
+    Keeps the solution of a configuration and repairs it when constraints are added or retracted.
+
+    inc = IncrementalBtSearch(MrvBtSearch(), config)
+    inc.solve()
+    handle = config.equal("a", "b")
+    inc.constraint_added(handle)
+    config.retractConstraint(handle)
+    inc.constraint_retracted(handle)
+
+    After a change only the variables of the changed constraint are searched again,
+    all other variables keep their previous value. If that fails the search region grows
+    by the neighbours of the region until it covers the whole configuration (a full solve).
+    The searches share a transposition table, so the searches of a growing region (and of later changes)
+    skip the assignments that already failed.
+
+    The limits apply to every single search (timeout in seconds, relative to the start of that search).
+    If a search runs out of budget, status is the limit status (eg. "timeout") and result is None,
+    the previous solution does not satisfy the new constraints. It is still used as the starting point:
+    the variables of changes that could not be repaired yet are searched again with the next change.
+    last_status is the status of the last single search (including the failed searches of a growing region).
+    """
+
+    _tool : BtSearchTools
+    _config : CpsConfiguration[TVar, TVal]
+    _timeout : float | None
+    _max_nodes : int | None
+    _max_depth : int | None
+    _transpositions : BtTranspositionTable[TVar, TVal]
+    _pending : Set[TVar]
+    # last solution found, the base of the repairs. Does not satisfy the constraints while _pending is not empty
+    _solution : Dict[TVar, TVal] | None
+
+    result : CpsState[TVar, TVal] | None
+    status : str | None
+    last_status : str | None
+    count : int
+    total_count : int
+    searched : int
+
+    def __init__(self, tool : BtSearchTools, config : CpsConfiguration[TVar, TVal], timeout : float | None = None, max_nodes : int | None = None, max_depth : int | None = None, transpositions : BtTranspositionTable[TVar, TVal] | None = None):
+        self._tool = tool
+        self._config = config
+        self._timeout = timeout
+        self._max_nodes = max_nodes
+        self._max_depth = max_depth
+        if transpositions is None:
+            transpositions = BtTranspositionTable()
+        self._transpositions = transpositions
+        self._pending = set()
+        self._solution = None
+        self.result = None
+        self.status = None
+        self.last_status = None
+        self.count = 0
+        self.total_count = 0
+        self.searched = 0
+
+
+    def solve(self) -> 'IncrementalBtSearch[TVar, TVal]':
+        """
+        Solve from scratch
+        """
+        self.count = 0
+        self.searched = len(self._config.variables())
+
+        search = self._search(CpsState(self._config))
+        if search.status in (BtSearchStatus.SOLVED, BtSearchStatus.UNSAT):
+            self._set_result(search)
+        else:
+            self._out_of_budget(search, set(self._config.variables()))
+        return self
+
+
+    def constraint_added(self, handle : CpsConstraintHandle[TVar, TVal]) -> 'IncrementalBtSearch[TVar, TVal]':
+        """
+        Update the solution after the constraint was added to the configuration
+        """
+        self.count = 0
+        self.searched = 0
+
+        if self.status == BtSearchStatus.UNSAT:
+            # more constraints can not make it solvable
+            return self
+
+        if self._solution is None:
+            return self.solve()
+
+        if handle.is_satisfied_by(self._solution) and len(self._pending) == 0:
+            # the previous solution is still valid
+            return self
+
+        self._repair(self._solution, self._pending.union(handle.get_variables()))
+        return self
+
+
+    def constraint_retracted(self, handle : CpsConstraintHandle[TVar, TVal]) -> 'IncrementalBtSearch[TVar, TVal]':
+        """
+        Update the solution after the constraint was removed from the configuration
+        """
+        self.count = 0
+        self.searched = 0
+
+        if self._solution is None:
+            return self.solve()
+
+        if len(self._pending) > 0:
+            # an earlier change was not repaired yet
+            self._repair(self._solution, self._pending)
+
+        # otherwise fewer constraints, the previous solution is still valid
+        return self
+
+
+    def _repair(self, assignments : Dict[TVar, TVal], conflict : Iterable[TVar]) -> None:
+        """
+        Search the conflict region again with all other variables fixed, grow the region until a solution is found.
+        If the budget runs out the region is kept as pending for the next change
+        """
+        variables = self._config.variables()
+        region = set(conflict)
+
+        while True:
+            state = CpsState(self._config)
+            for variable in variables:
+                if variable not in region:
+                    state = state.assign(variable, assignments[variable])
+
+            self.searched = len(region)
+            search = self._search(state)
+
+            if search.status == BtSearchStatus.SOLVED or (search.status == BtSearchStatus.UNSAT and len(region) == len(variables)):
+                # solved or a full search (then unsat is final)
+                self._set_result(search)
+                return
+
+            if search.status != BtSearchStatus.UNSAT:
+                self._out_of_budget(search, region)
+                return
+
+            grown = set(region)
+            for variable in region:
+                for neighbour in self._config.get_constraints(variable):
+                    if neighbour is not None:
+                        grown.add(neighbour)
+
+            if len(grown) == len(region):
+                # region is a closed component, everything else stays as is
+                grown = set(variables)
+            region = grown
+
+
+    def _set_result(self, search : BtSearch[TVar, TVal]) -> None:
+        """
+        Take the result of a solved or final unsat search
+        """
+        self.result = search.result
+        self.status = search.status
+        self._pending = set()
+        self._solution = search.result.get_assignments() if search.result is not None else None
+
+
+    def _out_of_budget(self, search : BtSearch[TVar, TVal], region : Set[TVar]) -> None:
+        """
+        No solution for the current constraints yet, keep the previous one only as base for the next repair
+        """
+        self.result = None
+        self.status = search.status
+        if self._solution is not None:
+            self._pending = set(region)
+
+
+    def _search(self, state : CpsState[TVar, TVal]) -> BtSearch[TVar, TVal]:
+        # fresh limits, the timeout starts with this search
+        limits = BtSearchLimits(timeout=self._timeout, max_nodes=self._max_nodes, max_depth=self._max_depth)
+        search = BtSearch.search(self._tool, state, limits, self._transpositions)
+
+        self.last_status = search.status
+        self.count = self.count + search.count
+        self.total_count = self.total_count + search.count
+        return search
@@ -0,0 +1,181 @@
+from typing import *
+import multiprocessing
+import os
+from cps import *
+from bt_search import *
+from bt_search import BtSearch, BtSearchTools
+
+TVar = TypeVar('TVar')
+TVal = TypeVar('TVal')
+
+
+# Worker side state. Set once per worker process by _init_worker (inherited through fork),
+# so the configuration with its lambdas never has to be pickled.
+_worker_tool : BtSearchTools = None
+_worker_state : CpsState = None
+_worker_cancel = None
+
+
+class BtSearchCancelled(Exception):
+    pass
+
+
+class CancellableBtSearch(BtSearch[TVar, TVal]):
+    """
+    Backtracking search that stops as soon as the shared cancel event is set
+    """
+
+    _cancel = None
+
+    # check the (shared) event only every n nodes, reading it takes a lock
+    CANCEL_CHECK_INTERVAL = 16
+
+    def __init__(self, tool: BtSearchTools, cancel):
+        super().__init__(tool)
+        self._cancel = cancel
+
+    def _search(self, state : CpsState[TVar, TVal], depth : int = 0) -> CpsState[TVar, TVal] | None:
+        if self.count % self.CANCEL_CHECK_INTERVAL == 0 and self._cancel.is_set():
+            raise BtSearchCancelled()
+
+        return super()._search(state, depth)
+
+
+def _init_worker(tool : BtSearchTools, initialState : CpsState, cancel) -> None:
+    global _worker_tool, _worker_state, _worker_cancel
+    _worker_tool = tool
+    _worker_state = initialState
+    _worker_cancel = cancel
+
+
+def _solve_subproblem(prefix : List[tuple[TVar, TVal]]) -> tuple[Dict[TVar, TVal] | None, int]:
+    """
+    Search the subtree below the given prefix assignments.
+    Returns the full assignment (or None) and the number of visited nodes
+    """
+
+    if _worker_cancel.is_set():
+        return None, 0
+
+    state = _worker_state
+    for variable, value in prefix:
+        state = state.assign(variable, value)
+
+    search = CancellableBtSearch(_worker_tool, _worker_cancel)
+    try:
+        result = search._search(state)
+    except BtSearchCancelled:
+        return None, search.count
+
+    if result is None:
+        return None, search.count
+    return result.get_assignments(), search.count
+
+
+class ParallelBtSearch(Generic[TVar, TVal]):
+    """
+    Parallel backtracking search for a single (hard) puzzle.
+    The top levels of the search tree are expanded into independent subproblems (fixed prefix assignments),
+    which are handed to a process pool. There are more subproblems than workers and they are handed out one by one,
+    so a worker that finishes early takes over the remaining subtrees. The first solution cancels all other workers.
+    """
+
+    _tool : BtSearchTools
+
+    count : int
+    result : CpsState[TVar, TVal] | None
+    subproblems : int
+
+    def __init__(self, tool: BtSearchTools):
+        self._tool = tool
+        self.count = 0
+        self.result = None
+        self.subproblems = 0
+
+
+    @staticmethod
+    def search(tool: BtSearchTools, initialState : CpsState[TVar, TVal], workers : int | None = None, subproblems_per_worker : int = 8) -> 'ParallelBtSearch[TVar, TVal]':
+        instance = ParallelBtSearch(tool)
+
+        if workers is None:
+            workers = os.cpu_count() or 1
+
+        if workers <= 1 or "fork" not in multiprocessing.get_all_start_methods():
+            # the configuration holds lambdas and can not be pickled, without fork there is no cheap way to share it
+            sequential = BtSearch.search(tool, initialState)
+            instance.count = sequential.count
+            instance.result = sequential.result
+            return instance
+
+        frontier = instance._split(initialState, workers * subproblems_per_worker)
+        if instance.result is not None or len(frontier) == 0:
+            return instance
+
+        instance.subproblems = len(frontier)
+
+        initial = initialState.get_assignments()
+        prefixes = []
+        for state in frontier:
+            prefixes.append([(var, val) for var, val in state.get_assignments().items() if var not in initial])
+
+        ctx = multiprocessing.get_context("fork")
+        cancel = ctx.Event()
+
+        with ctx.Pool(workers, initializer=_init_worker, initargs=(tool, initialState, cancel)) as pool:
+            # chunksize 1: idle workers pull the next open subtree from the shared queue
+            for assignments, count in pool.imap_unordered(_solve_subproblem, prefixes, chunksize=1):
+                instance.count = instance.count + count
+
+                if assignments is not None and instance.result is None:
+                    instance.result = instance._build_state(initialState, assignments)
+                    cancel.set()
+                    # keep collecting, the cancelled workers still report their node counts
+
+        return instance
+
+
+    def _split(self, initialState : CpsState[TVar, TVal], target : int) -> List[CpsState[TVar, TVal]]:
+        """
+        Expand the search tree breadth first until there are at least target open subproblems.
+        Nodes expanded here are counted just like in BtSearch._search
+        """
+
+        frontier = [initialState]
+
+        while 0 < len(frontier) < target:
+            next_frontier = []
+
+            for state in frontier:
+                if state.is_complete():
+                    self.result = state
+                    return []
+
+                if not state.is_consistent():
+                    continue
+
+                self.count = self.count + 1
+
+                variable = self._tool.get_next_variable(state)
+                if variable is None:
+                    continue
+
+                for value in self._tool.get_values(state, variable):
+                    if state.will_be_consistent(variable, value):
+                        new_state = state.assign(variable, value)
+
+                        if self._tool.inference(new_state, variable, value):
+                            next_frontier.append(new_state)
+
+            frontier = next_frontier
+
+        return frontier
+
+
+    def _build_state(self, initialState : CpsState[TVar, TVal], assignments : Dict[TVar, TVal]) -> CpsState[TVar, TVal]:
+        initial = initialState.get_assignments()
+
+        state = initialState
+        for variable, value in assignments.items():
+            if variable not in initial:
+                state = state.assign(variable, value)
+        return state
@@ -1,7 +1,9 @@
 from typing import *
 from abc import abstractmethod
+import time
+from collections import OrderedDict
 from cps import *
-from cps import CpsState
+from cps import CpsConfiguration, CpsState
 
 TVar = TypeVar('TVar')
 TVal = TypeVar('TVal')
@@ -28,6 +30,121 @@ class BtSearchTools(Generic[TVar, TVal]):
         raise NotImplementedError()
 
 
+class BtSearchStatus:
+    """
+    Outcome of a (possibly bounded) search
+    """
+    SOLVED = "solved"
+    UNSAT = "unsat"
+    TIMEOUT = "timeout"
+    NODE_LIMIT = "node-limit"
+    DEPTH_LIMIT = "depth-limit"
+
+
+class BtSearchLimits:
+    """
+    Bounds for a search. A limit that is None is not enforced.
+    The deadline is a time.monotonic() timestamp, use timeout to give it relative to now.
+    """
+    deadline : float | None
+    max_nodes : int | None
+    max_depth : int | None
+
+    def __init__(self, timeout : float | None = None, max_nodes : int | None = None, max_depth : int | None = None, deadline : float | None = None):
+        if timeout is not None:
+            deadline = time.monotonic() + timeout
+        self.deadline = deadline
+        self.max_nodes = max_nodes
+        self.max_depth = max_depth
+
+
+class BtSearchLimitReached(Exception):
+    status : str
+
+    def __init__(self, status : str):
+        super().__init__(status)
+        self.status = status
+
+
+class BtTranspositionTable(Generic[TVar, TVal]):
+    """
+    Bounded set of partial assignments whose subtree was searched completely without a solution,
+    shared by several searches of the same configuration, a hit cuts the repeated subtree off.
+    Keyed by the Zobrist hash of the state (CpsState.get_hash), the least recently used entry is evicted first.
+
+    A single search never hits: the next variable (MRV included) only depends on the assignments,
+    so every assignment is reached on one path only. Hits come from searches that repeat parts of each other,
+    like the growing regions of IncrementalBtSearch or a retry after a node or time limit.
+
+    Adding constraints keeps failures failures, the table only clears itself if a constraint is retracted
+    or it is used with another configuration.
+    """
+    
+    capacity : int
+    _failed : OrderedDict[int, None]
+    _config : CpsConfiguration[TVar, TVal] | None
+    _retractions : int
+    
+    hits : int
+    misses : int
+    stores : int
+    evictions : int
+    
+    def __init__(self, capacity : int = 100000):
+        self.capacity = capacity
+        self._failed = OrderedDict()
+        self._config = None
+        self._retractions = -1
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+    
+    def _check_configuration(self, state : CpsState[TVar, TVal]) -> None:
+        config = state.get_configuration()
+        if config is not self._config or config.retractions != self._retractions:
+            self._failed.clear()
+            self._config = config
+            self._retractions = config.retractions
+    
+    def is_failed(self, state : CpsState[TVar, TVal]) -> bool:
+        """
+        Check if the assignments of the state are known to have no solution
+        """
+        self._check_configuration(state)
+        
+        key = state.get_hash()
+        if key in self._failed:
+            self._failed.move_to_end(key)
+            self.hits += 1
+            return True
+        
+        self.misses += 1
+        return False
+    
+    def store_failed(self, state : CpsState[TVar, TVal]) -> None:
+        """
+        Remember that the assignments of the state have no solution
+        """
+        self._check_configuration(state)
+        
+        self._failed[state.get_hash()] = None
+        self.stores += 1
+        
+        if len(self._failed) > self.capacity:
+            self._failed.popitem(last=False)
+            self.evictions += 1
+    
+    def __len__(self):
+        return len(self._failed)
+    
+    def __str__(self):
+        return f'Transpositions: {len(self._failed)}/{self.capacity}, hits: {self.hits}, misses: {self.misses}, stores: {self.stores}, evictions: {self.evictions}'
+    
+    def __repr__(self):
+        return self.__str__()
+
+
 class BtSearch(Generic[TVar, TVal]):
     """
     Base container for Backtracking search.
@@ -35,37 +152,117 @@ class BtSearch(Generic[TVar, TVal]):
     """
     
     _tool : BtSearchTools
+    _deadline : float | None
+    _max_nodes : int | None
+    _max_depth : int | None
+    _depth_cuts : int
+    _transpositions : BtTranspositionTable[TVar, TVal] | None
     
     count : int
     result : CpsState[TVar, TVal] | None
+    status : str | None
+    
+    best : CpsState[TVar, TVal] | None
+    depth : int
+    elapsed : float
     
     dead_ends : List[CpsState[TVar, TVal]]
     trace : List[CpsState[TVar, TVal]]
     
-    def __init__(self, tool: BtSearchTools):
+    def __init__(self, tool: BtSearchTools, limits : BtSearchLimits | None = None, transpositions : BtTranspositionTable[TVar, TVal] | None = None):
         self._tool = tool
+        self._transpositions = transpositions
         self.count = 0
+        self.result = None
+        self.status = None
+        self.best = None
+        self.depth = -1
+        self.elapsed = 0.0
         self.dead_ends = []
         self.trace = []
         
+        if limits is None:
+            limits = BtSearchLimits()
+        self._deadline = limits.deadline
+        self._max_nodes = limits.max_nodes
+        self._max_depth = limits.max_depth
+        self._depth_cuts = 0
+        
     
     @staticmethod
-    def search(tool: BtSearchTools, initialState : CpsState[TVar, TVal]) -> 'BtSearch[TVar, TVal]':
-        instance = BtSearch(tool)
-        instance.result = instance._search(initialState)
+    def search(tool: BtSearchTools, initialState : CpsState[TVar, TVal], limits : BtSearchLimits | None = None, transpositions : BtTranspositionTable[TVar, TVal] | None = None) -> 'BtSearch[TVar, TVal]':
+        instance = BtSearch(tool, limits, transpositions)
+        instance._run(initialState)
         return instance
+    
+    def _run(self, initialState : CpsState[TVar, TVal]) -> None:
+        """
+        Run the search and fill result, status and the statistics
+        """
+        start = time.monotonic()
+        
+        try:
+            self.result = self._search(initialState)
+            
+            if self.result is not None:
+                self.status = BtSearchStatus.SOLVED
+            elif self._depth_cuts > 0:
+                self.status = BtSearchStatus.DEPTH_LIMIT
+            else:
+                self.status = BtSearchStatus.UNSAT
+                
+        except BtSearchLimitReached as ex:
+            self.result = None
+            self.status = ex.status
+        
+        except RecursionError:
+            # deeper than python allows, without a max_depth
+            self.result = None
+            self.status = BtSearchStatus.DEPTH_LIMIT
+        
+        self.elapsed = time.monotonic() - start
+        
+    def _check_limits(self, depth : int) -> bool:
+        """
+        Raises if the node or time budget is used up. Returns False if the depth limit prevents going deeper
+        """
+        if self._max_nodes is not None and self.count >= self._max_nodes:
+            raise BtSearchLimitReached(BtSearchStatus.NODE_LIMIT)
         
-    def _search(self, state : CpsState[TVar, TVal]) -> CpsState[TVar, TVal] | None:
+        if self._deadline is not None and time.monotonic() >= self._deadline:
+            raise BtSearchLimitReached(BtSearchStatus.TIMEOUT)
+        
+        if self._max_depth is not None and depth >= self._max_depth:
+            self._depth_cuts += 1
+            return False
+        
+        return True
+        
+    def _search(self, state : CpsState[TVar, TVal], depth : int = 0) -> CpsState[TVar, TVal] | None:
         
         self.trace.append(state)
         
+        if depth > self.depth:
+            # the deepest state reached so far is the best partial assignment
+            self.depth = depth
+            self.best = state
+        
         if state.is_complete():
             return state
         
+        if self._transpositions is not None and self._transpositions.is_failed(state):
+            return None
+        
         if not state.is_consistent():
+            if self._transpositions is not None:
+                self._transpositions.store_failed(state)
+            return None
+        
+        if not self._check_limits(depth):
             return None
         
         self.count = self.count + 1
+        depth_cuts = self._depth_cuts
         
         variable = self._tool.get_next_variable(state)
         if variable is None:
@@ -79,7 +276,7 @@ class BtSearch(Generic[TVar, TVal]):
                 
                 if self._tool.inference(new_state, variable, value):
                     recursed = True
-                    result = self._search(new_state)
+                    result = self._search(new_state, depth + 1)
                     
                     if result is not None:
                         return result
@@ -87,6 +284,10 @@ class BtSearch(Generic[TVar, TVal]):
         if not recursed:
             self.dead_ends.append(state)
         
+        if self._transpositions is not None and self._depth_cuts == depth_cuts:
+            # the whole subtree was searched, not only up to the depth limit
+            self._transpositions.store_failed(state)
+        
         return None
     
 
@@ -98,20 +299,13 @@ def get_bt_result(bt_search : BtSearch[TVar, TVal]) -> Dict[TVal, List[TVar]]:
         return {}
     
     
+    # invert the assignment in one pass instead of scanning it once per value
     d = {}
-    
-    assignments = bt_search.result.get_assignments()
-    
     for val in bt_search.result.get_values():
-        
-        d[val] = bt_search.result.get_variables_with(val)
-        # l = []
-        
-        # for var in assignments:
-        #     if assignments[var] == val:
-        #         l.append(var)
-                
-        # d[val] = l
+        d[val] = []
+    
+    for var, val in bt_search.result.get_assignments().items():
+        d[val].append(var)
         
     return d
     
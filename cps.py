@@ -2,6 +2,7 @@ from typing import *
 import inspect
 import dis
 import inspect, ast, textwrap
+import random
 
 TVar = TypeVar('TVar')
 TVal = TypeVar('TVal')
@@ -21,6 +22,25 @@ def lambda_source(lambda_func):
     return ast.get_source_segment(src, f.node) or src
 
 
+def cps_expression(expression : str):
+    """
+    Attach a python expression to a predicate, with {a} and {b} as placeholders for the two values.
+    The expression is inlined by the compiled consistency checks (see cps_compile), 
+    a predicate without one is called as a function there.
+    
+    @cps_expression("{a} < {b}")
+    def left_of(a, b): ...
+    """
+    def decorator(predicate):
+        predicate.cps_expression = expression
+        return predicate
+    return decorator
+
+
+def get_cps_expression(predicate) -> str | None:
+    return getattr(predicate, "cps_expression", None)
+
+
 class CpsConstraint(Generic[TVal]):
     _predicates : List[Callable[[TVal, TVal], bool]]
     _originals : List[tuple[Callable[[TVal, TVal], bool], Callable[[TVal, TVal], bool]]]
@@ -38,6 +58,16 @@ class CpsConstraint(Generic[TVal]):
         self._predicates.append(predicate)
         self._originals.append((predicate, original))
         
+    def remove(self, predicate: Callable[[TVal, TVal], bool]) -> None:
+        self._predicates.remove(predicate)
+        self._originals = [(c, o) for c, o in self._originals if c != predicate]
+        
+    def is_empty(self) -> bool:
+        return len(self._predicates) == 0
+    
+    def get_predicates(self) -> List[Callable[[TVal, TVal], bool]]:
+        return self._predicates.copy()
+        
     def is_conflicting(self, a: TVal, b: TVal) -> bool:
         """
         Check if the two values a and b would conflict with any constraint
@@ -75,16 +105,71 @@ class CpsConstraint(Generic[TVal]):
     
         
 
+class CpsConstraintHandle(Generic[TVar, TVal]):
+    """
+    The predicates added by one call to the configuration (source, target, predicate). 
+    Used to retract the constraint again.
+    """
+    entries : List[tuple[TVar, TVar, Callable[[TVal, TVal], bool]]]
+    all_different : List[TVar] | None
+    
+    def __init__(self, entries : List[tuple[TVar, TVar, Callable[[TVal, TVal], bool]]] = None):
+        self.entries = entries if entries is not None else []
+        self.all_different = None
+        
+    def extend(self, other : 'CpsConstraintHandle[TVar, TVal]') -> None:
+        self.entries.extend(other.entries)
+    
+    def get_variables(self) -> List[TVar]:
+        """
+        All variables the constraint refers to
+        """
+        variables = []
+        for source, target, _ in self.entries:
+            for var in [source, target]:
+                if var is not None and var not in variables:
+                    variables.append(var)
+        return variables
+    
+    def is_satisfied_by(self, assignments : Dict[TVar, TVal]) -> bool:
+        """
+        Check the constraint against a (complete) assignment
+        """
+        for source, target, predicate in self.entries:
+            a = assignments.get(source)
+            b = assignments.get(target) if target is not None else None
+            
+            if a is None or (target is not None and b is None):
+                continue
+            
+            if not predicate(a, b):
+                return False
+        return True
+    
+
 class CpsConfiguration(Generic[TVar, TVal]):
     _variables : List[TVar]
     _values : List[TVal]
     _constraints: Dict[TVar, Dict[TVar, CpsConstraint[TVal]]]
+    _all_different : List[List[TVar]]
+    _compiled = None
+    _zobrist_keys = None
+    
+    # incremented with every change of the constraints
+    version : int
+    # incremented with every retracted constraint
+    retractions : int
     
     
     def __init__(self, variables : List[str], values : List[str]):
         self._variables = variables
         self._values = values
         self._constraints = {}
+        self._all_different = []
+        self._compiled = None
+        self._zobrist_keys = None
+        self.version = 0
+        self.retractions = 0
 
     def variables(self) -> List[TVar]:
         return self._variables.copy()
@@ -102,7 +187,7 @@ class CpsConfiguration(Generic[TVar, TVal]):
             s[target] = CpsConstraint()
             
     
-    def addConstraint(self, source : TVar, target : TVar, predicate : Callable[[TVal, TVal], bool]) -> None:
+    def addConstraint(self, source : TVar, target : TVar, predicate : Callable[[TVal, TVal], bool]) -> CpsConstraintHandle[TVar, TVal]:
         """
         Add a new, one directional constraint
         """
@@ -110,9 +195,12 @@ class CpsConfiguration(Generic[TVar, TVal]):
         self._ensure_exists(source, target)
         
         self._constraints[source][target].append(predicate)
+        self.version += 1
+        
+        return CpsConstraintHandle([(source, target, predicate)])
     
         
-    def addConstraintRev(self, source : TVar, target : TVar, predicate : Callable[[TVal, TVal], bool]) -> None:
+    def addConstraintRev(self, source : TVar, target : TVar, predicate : Callable[[TVal, TVal], bool]) -> CpsConstraintHandle[TVar, TVal]:
         """
         Add a new, two directional constraint.
         For the target -> source direction the parameters for the predicate are swapped, so the predicate is still called with (source, target)
@@ -121,48 +209,130 @@ class CpsConfiguration(Generic[TVar, TVal]):
         self._ensure_exists(source, target)
         self._constraints[source][target].append(predicate)
         
+        reverse = lambda a, b: predicate(b, a)
+        expression = get_cps_expression(predicate)
+        if expression is not None:
+            reverse = cps_expression(expression.format(a="{b}", b="{a}"))(reverse)
+        
         self._ensure_exists(target, source)
-        self._constraints[target][source].append_rev(lambda a, b: predicate(b, a), predicate)
+        self._constraints[target][source].append_rev(reverse, predicate)
+        self.version += 1
+        
+        return CpsConstraintHandle([(source, target, predicate), (target, source, reverse)])
     
     
-    def addUnaryConstraint(self, source : TVar, predicate : Callable[[TVal], bool]) -> None:
+    def addUnaryConstraint(self, source : TVar, predicate : Callable[[TVal], bool]) -> CpsConstraintHandle[TVar, TVal]:
         """
         Add a new unary constraint. 
         This is a constraint that does not have a target (eg. var must be val)
         """
         self._ensure_exists(source, None)
         
-        self._constraints[source][None].append(lambda a, b: predicate(a))    
+        unary = lambda a, b: predicate(a)
+        expression = get_cps_expression(predicate)
+        if expression is not None:
+            unary = cps_expression(expression)(unary)
+        
+        self._constraints[source][None].append(unary)
+        self.version += 1
+        
+        return CpsConstraintHandle([(source, None, unary)])
         
         
-    def allNotEqual(self, variables : List[TVar]) -> None:
+    def allNotEqual(self, variables : List[TVar]) -> CpsConstraintHandle[TVar, TVal]:
         """
         Constraint all variables against each other. (ie. all must have different values)
         """        
+        handle = CpsConstraintHandle()
         for source in variables:
             for target in variables:
                 if source == target:
                     continue
                 
-                self.addConstraint(source, target, lambda a, b: a != b)
+                handle.extend(self.addConstraint(source, target, cps_expression("{a} != {b}")(lambda a, b: a != b)))
+        
+        # remember the group, the pairwise constraints alone hide that all values are taken (see cps_deduction)
+        handle.all_different = list(variables)
+        self._all_different.append(handle.all_different)
+        return handle
 
                 
-    def notEqual(self, source : TVar, target : TVar) -> None:
-        self.addConstraintRev(source, target, lambda a, b: a != b)
+    def notEqual(self, source : TVar, target : TVar) -> CpsConstraintHandle[TVar, TVal]:
+        return self.addConstraintRev(source, target, cps_expression("{a} != {b}")(lambda a, b: a != b))
 
         
-    def equal(self, source : TVar, target : TVar) -> None:
-        self.addConstraintRev(source, target, lambda a, b: a == b)
+    def equal(self, source : TVar, target : TVar) -> CpsConstraintHandle[TVar, TVal]:
+        return self.addConstraintRev(source, target, cps_expression("{a} == {b}")(lambda a, b: a == b))
 
 
-    def mustBe(self, source : TVar, value : TVal) -> None:
-        self.addUnaryConstraint(source, lambda a: a == value)
+    def mustBe(self, source : TVar, value : TVal) -> CpsConstraintHandle[TVar, TVal]:
+        return self.addUnaryConstraint(source, self._with_value_expression(lambda a: a == value, "{a} == ", value))
+    
+    def mustNotBe(self, source : TVar, value : TVal) -> CpsConstraintHandle[TVar, TVal]:
+        return self.addUnaryConstraint(source, self._with_value_expression(lambda a: a != value, "{a} != ", value))
+    
+    def _with_value_expression(self, predicate, expression : str, value : TVal):
+        # only values that can be written as a literal can be inlined
+        if isinstance(value, (int, str)):
+            return cps_expression(expression + repr(value).replace("{", "{{").replace("}", "}}"))(predicate)
+        return predicate
     
-    def mustNotBe(self, source : TVar, value : TVal) -> None:
-        self.addUnaryConstraint(source, lambda a: a != value)
+    
+    def retractConstraint(self, handle : CpsConstraintHandle[TVar, TVal]) -> None:
+        """
+        Remove a constraint that was added before. 
+        """
+        for source, target, predicate in handle.entries:
+            constraint = self._constraints[source][target]
+            constraint.remove(predicate)
+            
+            if constraint.is_empty():
+                del self._constraints[source][target]
+        
+        if handle.all_different is not None:
+            self._all_different = [g for g in self._all_different if g is not handle.all_different]
+        
+        self.version += 1
+        self.retractions += 1
 
     def get_constraints(self, variable : TVar) -> Dict[TVar, CpsConstraint[TVal] ]:
-        return self._constraints[variable]
+        return self._constraints.get(variable, {})
+    
+    def compile(self) -> None:
+        """
+        Generate specialized consistency checks for the current constraints (see cps_compile).
+        CpsState.will_be_consistent uses them until the constraints change again
+        """
+        from cps_compile import compile_configuration
+        self._compiled = compile_configuration(self)
+    
+    def get_compiled_checks(self) -> Dict[TVar, Callable[[TVal, Dict[TVar, TVal]], bool]] | None:
+        """
+        The compiled checks, None if not compiled or the constraints changed since
+        """
+        if self._compiled is None:
+            return None
+        if self._compiled.version != self.version:
+            self._compiled = None
+            return None
+        return self._compiled.checks
+    
+    def get_all_different(self) -> List[List[TVar]]:
+        """
+        Groups of variables added with allNotEqual
+        """
+        return [g.copy() for g in self._all_different]
+    
+    def get_zobrist_keys(self) -> Dict[tuple[TVar, TVal], int]:
+        """
+        A random 64 bit key per (variable, value). The hash of an assignment is the xor of its keys (see CpsState.get_hash)
+        """
+        if self._zobrist_keys is None:
+            self._zobrist_keys = {}
+            for var in self._variables:
+                for val in self._values:
+                    self._zobrist_keys[(var, val)] = random.getrandbits(64)
+        return self._zobrist_keys
     
     def __str__(self):
         s = 'CPS-Config {\n'
@@ -195,6 +365,7 @@ class CpsState(Generic[TVar, TVal]):
     _config : CpsConfiguration[TVar, TVal]    
     _assigned_cache = None
     _unassigned_cache = None
+    _hash : int | None = None
     
     
     def __init__(self, config : CpsConfiguration[TVar, TVal], parent = None, variable : TVar = None, value : TVal = None):
@@ -236,7 +407,16 @@ class CpsState(Generic[TVar, TVal]):
         t2 = self._parent.get_assignments()
         t2[self._variable] = self._value
         self._assigned_cache = t2
-        return t2
+        return t2.copy() # the cache must not be modified by the caller either
+    
+    
+    def get_assignments_view(self) -> Dict[TVar, TVal]:
+        """
+        Like get_assignments, but returns the cached dictionary itself instead of a copy. Must not be modified
+        """
+        if self._assigned_cache is None:
+            self._assigned_cache = self.get_assignments()
+        return self._assigned_cache
     
     
     def get_assignment(self, variable: TVar):
@@ -250,6 +430,31 @@ class CpsState(Generic[TVar, TVal]):
         return None
     
     
+    def get_hash(self) -> int:
+        """
+        Zobrist hash of the assignments, independent of the order they were made in.
+        Updated incrementally from the parent, so it costs O(1) per state
+        """
+        if self._hash is not None:
+            return self._hash
+        
+        if self._parent is None:
+            self._hash = 0
+            return self._hash
+        
+        h = self._parent.get_hash()
+        if self._variable is not None:
+            keys = self._config.get_zobrist_keys()
+            previous = self._parent.get_assignments_view().get(self._variable)
+            if previous is not None:
+                # reassigned variable, remove the old value
+                h ^= keys[(self._variable, previous)]
+            h ^= keys[(self._variable, self._value)]
+        
+        self._hash = h
+        return h
+    
+    
     def get_unassigned(self) -> List[TVar]:
         """
         Get all variables that currently have no assignment
@@ -266,6 +471,9 @@ class CpsState(Generic[TVar, TVal]):
         return vars
     
     
+    def get_configuration(self) -> CpsConfiguration[TVar, TVal]:
+        return self._config
+    
     def get_variables(self) -> List[TVar]:
         return self._config.variables().copy()
     
@@ -313,6 +521,10 @@ class CpsState(Generic[TVar, TVal]):
         Check if a variable assignment would be consistent
         """
         
+        checks = self._config.get_compiled_checks()
+        if checks is not None:
+            return checks[variable](value, self.get_assignments_view())
+        
         constraints = self._config.get_constraints(variable)
         
         for var in constraints:
@@ -0,0 +1,359 @@
+"""
+Batched solving of many puzzles with the same size.
+
+The domains of all puzzles of a batch are one boolean tensor (puzzle x variable x house).
+Unary, binary (equal, nextTo, leftOf, ...) and allNotEqual propagation runs on the whole batch with array operations.
+Only the puzzles that propagation can not resolve are solved one by one, the same way as puzzleSolver.solve_puzzle.
+
+Variables are numbered group by group, so variable g * houses + k is member k of group g.
+"""
+
+from typing import *
+import re
+import numpy as np
+from cps import *
+from bt_search import *
+from cps_deduction import DeductionBtSearch
+from puzzleParser import *
+from puzzleParser import analyze_puzzle_text
+from puzzleSolver import *
+from puzzleSolver import build_grid_solution, configure_cps
+
+
+# predicate (source house, target house) of each binary clue function, see puzzleSolver.add_clue
+BINARY_RELATIONS : Dict[str, Callable[[int, int], bool]] = {
+    "equal": lambda a, b: a == b,
+    "notEqual": lambda a, b: a != b,
+    "dLeftOf": direct_left_of,
+    "dRightOf": direct_right_of,
+    "leftOf": left_of,
+    "rightOf": right_of,
+    "nextTo": next_door,
+    "oneBetween": one_between,
+    "twoBetween": two_between,
+}
+
+_UNARY_FUNCTION = re.compile(r'(is|not)(\d+)$')
+
+
+class BatchSolveResult:
+    """
+    Result of a single puzzle of a batch.
+    propagated is True if the batch propagation alone solved it (no search nodes),
+    then deduction_steps are the domain reductions of the batch passes instead of the CpsDeduction steps
+    """
+    assignments : Dict[str, int] | None
+    status : str
+    nodes : int
+    deduction_steps : int
+    propagated : bool
+
+    def __init__(self, assignments : Dict[str, int] | None, status : str, nodes : int = 0, deduction_steps : int = 0, propagated : bool = False):
+        self.assignments = assignments
+        self.status = status
+        self.nodes = nodes
+        self.deduction_steps = deduction_steps
+        self.propagated = propagated
+
+    def get_steps(self) -> int:
+        """
+        Deduction steps and search nodes together, like solve_puzzle
+        """
+        return self.deduction_steps + self.nodes
+
+    def __str__(self):
+        return f'{self.status} (nodes: {self.nodes}, deduction steps: {self.deduction_steps}, propagated: {self.propagated})'
+
+    def __repr__(self):
+        return self.__str__()
+
+
+def get_batch_key(definition : PzPuzzleDefinition) -> tuple[int, int] | None:
+    """
+    (houses, groups) of a valid puzzle, None if it can not be part of a batch:
+    groups with a different size than the house count, a variable name in more than one group
+    (the batch indexes the variables by name) or a clue function the batch does not know
+    """
+    names = set()
+    for g in definition.variables:
+        if len(g.variables) != definition.house_count:
+            return None
+        for var in g.variables:
+            if var.name in names:
+                return None
+            names.add(var.name)
+
+    for clue in definition.clues:
+        if clue.function not in BINARY_RELATIONS and _UNARY_FUNCTION.match(clue.function) is None:
+            return None
+
+    return definition.house_count, len(definition.variables)
+
+
+class BatchPropagation:
+    """
+    Propagation on the stacked domains of puzzles that share houses and groups
+    """
+
+    houses : int
+    groups : int
+    domains : np.ndarray
+    steps : np.ndarray
+
+    _unary : List[tuple[int, int, int, bool]]
+    _binary : Dict[str, tuple[np.ndarray, np.ndarray, np.ndarray]]
+    _matrices : Dict[str, np.ndarray]
+
+    def __init__(self, definitions : List[PzPuzzleDefinition], houses : int, groups : int):
+        self.houses = houses
+        self.groups = groups
+        self.domains = np.ones((len(definitions), houses * groups, houses), dtype=bool)
+        self.steps = np.zeros(len(definitions), dtype=np.int64)
+
+        self._unary = []
+        binary = {name: ([], [], []) for name in BINARY_RELATIONS}
+
+        for p, definition in enumerate(definitions):
+            index = {}
+            for g, group in enumerate(definition.variables):
+                for k, var in enumerate(group.variables):
+                    index[var.name] = g * houses + k
+
+            for clue in definition.clues:
+                unary = _UNARY_FUNCTION.match(clue.function)
+                if unary is not None:
+                    self._unary.append((p, index[clue.variables[0]], int(unary[2]) - 1, unary[1] == "is"))
+                    continue
+
+                if clue.function not in binary:
+                    raise Exception(f'Function not implemented: "{clue.function}"')
+
+                ps, xs, ys = binary[clue.function]
+                ps.append(p)
+                xs.append(index[clue.variables[0]])
+                ys.append(index[clue.variables[1]])
+
+        self._binary = {}
+        self._matrices = {}
+        for name, (ps, xs, ys) in binary.items():
+            if len(ps) == 0:
+                continue
+            self._binary[name] = (np.array(ps), np.array(xs), np.array(ys))
+
+            # matrix[a, b]: source in house a + 1 and target in house b + 1 are compatible
+            relation = BINARY_RELATIONS[name]
+            matrix = np.zeros((houses, houses), dtype=np.uint8)
+            for a in range(houses):
+                for b in range(houses):
+                    matrix[a, b] = relation(a + 1, b + 1)
+            self._matrices[name] = matrix
+
+
+    def run(self, max_iterations : int = 1000) -> int:
+        """
+        Propagate until the domains do not change anymore. Returns the number of iterations
+        """
+        before = self.domains.copy()
+        self._apply_unary()
+        self._count_steps(before)
+
+        for iteration in range(1, max_iterations + 1):
+            before = self.domains.copy()
+
+            self._apply_binary()
+            self._apply_all_different()
+            self._count_steps(before)
+
+            if np.array_equal(before, self.domains):
+                return iteration
+
+        return max_iterations
+
+
+    def _count_steps(self, before : np.ndarray) -> None:
+        # one step per variable whose domain got smaller
+        self.steps += (before != self.domains).any(axis=2).sum(axis=1)
+
+
+    def _apply_unary(self) -> None:
+        for p, var, house, is_house in self._unary:
+            if house < 0 or house >= self.houses:
+                # a house that does not exist, mustBe can never be satisfied
+                if is_house:
+                    self.domains[p, var, :] = False
+            elif is_house:
+                keep = self.domains[p, var, house]
+                self.domains[p, var, :] = False
+                self.domains[p, var, house] = keep
+            else:
+                self.domains[p, var, house] = False
+
+
+    def _apply_binary(self) -> None:
+        """
+        Remove houses without support in the other variable, in both directions, for all constraints of a type at once
+        """
+        for name, (ps, xs, ys) in self._binary.items():
+            matrix = self._matrices[name]
+
+            source_support = (self.domains[ps, ys].astype(np.uint8) @ matrix.T) > 0
+            np.logical_and.at(self.domains, (ps, xs), source_support)
+
+            target_support = (self.domains[ps, xs].astype(np.uint8) @ matrix) > 0
+            np.logical_and.at(self.domains, (ps, ys), target_support)
+
+
+    def _apply_all_different(self) -> None:
+        # (puzzle, group, member, house), a view on the domains
+        domains = self.domains.reshape(len(self.domains), self.groups, self.houses, self.houses)
+
+        # naked singles: a determined member takes its house from all other members of the group
+        single = (domains.sum(axis=3) == 1)[:, :, :, None] & domains
+        taken = single.sum(axis=2, keepdims=True)
+        domains &= (taken - single) == 0
+
+        # hidden singles: a house that only one member of the group can take
+        candidates = domains.sum(axis=2, keepdims=True)
+        hidden = domains & (candidates == 1)
+        has_hidden = hidden.any(axis=3, keepdims=True)
+        domains[...] = np.where(has_hidden, hidden, domains)
+
+
+    def is_failed(self) -> np.ndarray:
+        """
+        Puzzles with an empty domain (no solution)
+        """
+        return ~self.domains.any(axis=2).all(axis=1)
+
+    def is_resolved(self) -> np.ndarray:
+        """
+        Puzzles where every variable has exactly one house
+        """
+        return (self.domains.sum(axis=2) == 1).all(axis=1)
+
+    def get_assignments(self, p : int, definition : PzPuzzleDefinition) -> Dict[str, int]:
+        """
+        The determined variables of a puzzle (house numbers start at 1)
+        """
+        determined = self.domains[p].sum(axis=1) == 1
+        houses = self.domains[p].argmax(axis=1)
+
+        assignments = {}
+        for g, group in enumerate(definition.variables):
+            for k, var in enumerate(group.variables):
+                v = g * self.houses + k
+                if determined[v]:
+                    assignments[var.name] = int(houses[v]) + 1
+        return assignments
+
+
+def _search_single(definition : PzPuzzleDefinition, timeout : float | None) -> BatchSolveResult:
+    """
+    Solve a puzzle that propagation left unresolved (or that can not be batched) like solve_puzzle does,
+    so nodes and deduction steps are the same as there
+    """
+    config = configure_cps(definition)
+    config.compile()
+
+    limits = BtSearchLimits(timeout=timeout, max_depth=len(config.variables()))
+    search = DeductionBtSearch.search(MrvBtSearch(), CpsState(config), limits)
+
+    assignments = None
+    if search.result is not None:
+        assignments = search.result.get_assignments()
+
+    return BatchSolveResult(assignments, search.status, search.count, search.deduction_steps)
+
+
+def _try_search_single(definition : PzPuzzleDefinition, timeout : float | None) -> BatchSolveResult:
+    """
+    _search_single, but a failing puzzle gets the status "error" instead of failing the whole batch
+    """
+    try:
+        return _search_single(definition, timeout)
+    except Exception:
+        return BatchSolveResult(None, "error")
+
+
+def solve_batch(definitions : List[PzPuzzleDefinition | None], timeout : float | None = None) -> List[BatchSolveResult]:
+    """
+    Solve parsed puzzles (None for a puzzle that could not be parsed). Puzzles are grouped by size and propagated together,
+    the unresolved ones fall back to the search. Results are in the order of the definitions
+    """
+
+    results : List[BatchSolveResult | None] = [None] * len(definitions)
+    batches : Dict[tuple[int, int], List[int]] = {}
+
+    for i, definition in enumerate(definitions):
+        if definition is None or not definition.is_valid():
+            results[i] = BatchSolveResult(None, "invalid")
+            continue
+
+        key = get_batch_key(definition)
+        if key is None:
+            results[i] = _try_search_single(definition, timeout)
+            continue
+        if key not in batches:
+            batches[key] = []
+        batches[key].append(i)
+
+    for (houses, groups), members in batches.items():
+        batch = [definitions[i] for i in members]
+
+        try:
+            propagation = BatchPropagation(batch, houses, groups)
+            propagation.run()
+        except Exception:
+            # solve them one by one, so only the failing puzzle gets an error
+            for p, i in enumerate(members):
+                results[i] = _try_search_single(batch[p], timeout)
+            continue
+
+        failed = propagation.is_failed()
+        resolved = propagation.is_resolved()
+
+        for p, i in enumerate(members):
+            if failed[p]:
+                results[i] = BatchSolveResult(None, BtSearchStatus.UNSAT)
+            elif resolved[p]:
+                results[i] = BatchSolveResult(propagation.get_assignments(p, batch[p]), BtSearchStatus.SOLVED, 0, int(propagation.steps[p]), True)
+            else:
+                results[i] = _try_search_single(batch[p], timeout)
+
+    return results
+
+
+def solve_puzzle_batch(puzzle_texts : List[str], headers : List[List[str] | None] | None = None, timeout : float | None = None) -> List[Dict[str, Any]]:
+    """
+    Batched version of puzzleSolver.solve_puzzle, returns the same dictionaries in the same order.
+    A puzzle that can not be parsed gets the status "invalid", one that fails while solving the status "error",
+    the others are solved anyway
+    """
+
+    definitions = []
+    for text in puzzle_texts:
+        try:
+            definitions.append(analyze_puzzle_text(text))
+        except Exception:
+            definitions.append(None)
+
+    solutions = []
+    for i, (definition, result) in enumerate(zip(definitions, solve_batch(definitions, timeout))):
+        status = result.status
+        grid_solution = None
+        if result.assignments is not None:
+            header = headers[i] if headers is not None else None
+            try:
+                grid_solution = build_grid_solution(definition, result.assignments, header)
+            except Exception:
+                status = "error"
+
+        solutions.append({
+            "grid_solution": grid_solution,
+            "steps": result.get_steps(),
+            "status": status,
+            "nodes": result.nodes,
+            "deduction_steps": result.deduction_steps,
+        })
+
+    return solutions
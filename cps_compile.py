@@ -0,0 +1,132 @@
+"""
+Code generation of the consistency checks.
+
+For every variable one function is generated, that checks a value against all constraints of the variable
+with the expressions of the predicates inlined, eg:
+
+def _check_3(value, assignments):
+    if not (value != 3):
+        return False
+    other = assignments.get(_v0)
+    if other is not None and not ((value != other) and (value + 1 == other)):
+        return False
+    ...
+    return True
+
+Variables and predicates without an expression are passed in as constants (_v0, _p0, ...),
+so configurations with the same structure produce the same source and share the compiled code.
+"""
+
+from typing import *
+import hashlib
+from collections import OrderedDict
+from cps import *
+from cps import CpsConfiguration, get_cps_expression
+
+TVar = TypeVar('TVar')
+TVal = TypeVar('TVal')
+
+
+class CpsCompiledChecks(Generic[TVar, TVal]):
+    """
+    The generated check function per variable, valid for one version of the configuration
+    """
+    version : int
+    fingerprint : str
+    checks : Dict[TVar, Callable[[TVal, Dict[TVar, TVal]], bool]]
+
+    def __init__(self, version : int, fingerprint : str, checks : Dict[TVar, Callable[[TVal, Dict[TVar, TVal]], bool]]):
+        self.version = version
+        self.fingerprint = fingerprint
+        self.checks = checks
+
+
+# compiled code by fingerprint (hash of the generated source)
+_code_cache : OrderedDict[str, Any] = OrderedDict()
+CODE_CACHE_SIZE = 256
+
+
+def _predicate_source(predicate, constants : Dict[str, Any], a : str, b : str) -> str:
+    expression = get_cps_expression(predicate)
+    if expression is not None:
+        return "(" + expression.format(a=a, b=b) + ")"
+
+    name = f'_p{len(constants)}'
+    constants[name] = predicate
+    return f'{name}({a}, {b})'
+
+
+def generate_source(config : CpsConfiguration[TVar, TVal]) -> tuple[str, Dict[str, Any], List[str]]:
+    """
+    Build the source of all check functions.
+    Returns the source, the constants it refers to and the function name for each variable (in variable order)
+    """
+
+    variables = config.variables()
+    constants = {}
+    variable_names = {}
+
+    for index, var in enumerate(variables):
+        variable_names[var] = f'_v{index}'
+        constants[f'_v{index}'] = var
+
+    lines = []
+    functions = []
+
+    for index, var in enumerate(variables):
+        function = f'_check_{index}'
+        functions.append(function)
+        lines.append(f'def {function}(value, assignments):')
+
+        constraints = config.get_constraints(var)
+        for target, constraint in constraints.items():
+            predicates = constraint.get_predicates()
+            if len(predicates) == 0:
+                continue
+
+            if target is None:
+                condition = " and ".join(_predicate_source(p, constants, "value", "None") for p in predicates)
+                lines.append(f'    if not ({condition}):')
+                lines.append(f'        return False')
+                continue
+
+            if target not in variable_names:
+                # constraint on an unknown variable, never assigned
+                continue
+
+            condition = " and ".join(_predicate_source(p, constants, "value", "other") for p in predicates)
+            lines.append(f'    other = assignments.get({variable_names[target]})')
+            lines.append(f'    if other is not None and not ({condition}):')
+            lines.append(f'        return False')
+
+        lines.append(f'    return True')
+        lines.append('')
+
+    return "\n".join(lines), constants, functions
+
+
+def compile_configuration(config : CpsConfiguration[TVar, TVal]) -> CpsCompiledChecks[TVar, TVal]:
+    """
+    Generate, compile and load the check functions of a configuration
+    """
+
+    source, constants, functions = generate_source(config)
+    fingerprint = hashlib.sha1(source.encode()).hexdigest()
+
+    if fingerprint in _code_cache:
+        _code_cache.move_to_end(fingerprint)
+        code = _code_cache[fingerprint]
+    else:
+        code = compile(source, f'<cps-checks {fingerprint[:12]}>', 'exec')
+        _code_cache[fingerprint] = code
+        if len(_code_cache) > CODE_CACHE_SIZE:
+            _code_cache.popitem(last=False)
+
+    namespace = dict(constants)
+    exec(code, namespace)
+
+    checks = {}
+    for var, function in zip(config.variables(), functions):
+        checks[var] = namespace[function]
+
+    return CpsCompiledChecks(config.version, fingerprint, checks)
@@ -0,0 +1,277 @@
+from typing import *
+from cps import *
+from cps import CpsConfiguration, CpsState
+from bt_search import *
+from bt_search import BtSearch, BtSearchLimits, BtSearchStatus, BtSearchTools, BtTranspositionTable
+
+TVar = TypeVar('TVar')
+TVal = TypeVar('TVal')
+
+
+class CpsDeduction(Generic[TVar, TVal]):
+    """
+    Propagation to a fixpoint on the domains of all variables. No guessing involved.
+    Rules:
+     - unary constraints remove values directly
+     - binary constraints remove values without support in the other domain
+       (covers nextTo / leftOf / oneBetween ..., equal chains and naked singles of allNotEqual)
+     - hidden singles: a value that fits only one variable of an allNotEqual group is assigned to it
+    """
+
+    _config : CpsConfiguration[TVar, TVal]
+    _watchers : Dict[TVar, List[TVar]]
+
+    domains : Dict[TVar, List[TVal]]
+    steps : int
+
+    def __init__(self, config : CpsConfiguration[TVar, TVal], assignments : Dict[TVar, TVal] | None = None):
+        self._config = config
+        self.steps = 0
+        self.domains = {}
+
+        values = config.values()
+        for var in config.variables():
+            if assignments is not None and var in assignments:
+                self.domains[var] = [assignments[var]]
+            else:
+                self.domains[var] = values.copy()
+
+        # x watches y if x has a constraint on y, a change of y can remove values from x
+        self._watchers = {var: [] for var in config.variables()}
+        for var in config.variables():
+            for target in config.get_constraints(var):
+                if target is not None:
+                    self._watchers[target].append(var)
+
+
+    def run(self) -> bool:
+        """
+        Propagate until nothing changes. Returns False if a domain became empty (no solution)
+        """
+
+        if not self._apply_unary():
+            return False
+
+        queue = list(self._config.variables())
+
+        while True:
+            if not self._propagate(queue):
+                return False
+
+            changed = self._hidden_singles()
+            if changed is None:
+                return False
+            if len(changed) == 0:
+                return True
+
+            queue = changed
+
+
+    def is_solved(self) -> bool:
+        for domain in self.domains.values():
+            if len(domain) != 1:
+                return False
+        return True
+
+    def get_assignments(self) -> Dict[TVar, TVal]:
+        """
+        All variables that are determined
+        """
+        return {var: domain[0] for var, domain in self.domains.items() if len(domain) == 1}
+
+
+    def _apply_unary(self) -> bool:
+        for var in self._config.variables():
+            constraint = self._config.get_constraints(var).get(None)
+            if constraint is None:
+                continue
+
+            domain = self.domains[var]
+            reduced = [val for val in domain if not constraint.is_conflicting(val, None)]
+            if len(reduced) != len(domain):
+                self.domains[var] = reduced
+                self.steps += 1
+                if len(reduced) == 0:
+                    return False
+        return True
+
+
+    def _propagate(self, queue : List[TVar]) -> bool:
+        """
+        Revise every variable that watches a changed variable (AC-3 style)
+        """
+        pending = set(queue)
+
+        while len(queue) > 0:
+            changed = queue.pop()
+            pending.discard(changed)
+
+            for var in self._watchers[changed]:
+                if self._revise(var, changed):
+                    if len(self.domains[var]) == 0:
+                        return False
+                    if var not in pending:
+                        pending.add(var)
+                        queue.append(var)
+        return True
+
+
+    def _revise(self, var : TVar, other : TVar) -> bool:
+        """
+        Remove the values of var that conflict with every value of other
+        """
+        constraint = self._config.get_constraints(var)[other]
+        other_domain = self.domains[other]
+        domain = self.domains[var]
+
+        reduced = []
+        for val in domain:
+            for other_val in other_domain:
+                if not constraint.is_conflicting(val, other_val):
+                    reduced.append(val)
+                    break
+
+        if len(reduced) == len(domain):
+            return False
+
+        self.domains[var] = reduced
+        self.steps += 1
+        return True
+
+
+    def _hidden_singles(self) -> List[TVar] | None:
+        """
+        Assign values that only fit one variable of an allNotEqual group.
+        Returns the changed variables, None on a contradiction
+        """
+        values = self._config.values()
+        changed = []
+
+        for group in self._config.get_all_different():
+            # only if the group has to use every value
+            if len(group) != len(values):
+                continue
+
+            for val in values:
+                candidates = [var for var in group if val in self.domains[var]]
+
+                if len(candidates) == 0:
+                    return None
+
+                if len(candidates) == 1 and len(self.domains[candidates[0]]) > 1:
+                    self.domains[candidates[0]] = [val]
+                    self.steps += 1
+                    changed.append(candidates[0])
+
+        return changed
+
+
+class DomainBtSearch(Generic[TVar, TVal], BtSearchTools[TVar, TVal]):
+    """
+    Wraps another search tool and only offers the values left by the deduction
+    """
+
+    _tool : BtSearchTools
+    _domains : Dict[TVar, List[TVal]]
+
+    def __init__(self, tool : BtSearchTools, domains : Dict[TVar, List[TVal]]):
+        self._tool = tool
+        self._domains = domains
+
+    def get_next_variable(self, state : CpsState[TVar, TVal]):
+        return self._tool.get_next_variable(state)
+
+    def get_values(self, state : CpsState[TVar, TVal], variable : TVar) -> List[TVal]:
+        domain = self._domains[variable]
+        return [val for val in self._tool.get_values(state, variable) if val in domain]
+
+    def inference(self, state : CpsState[TVar, TVal], variable : TVar, value : TVal) -> bool:
+        return self._tool.inference(state, variable, value)
+
+
+class DeductionBtSearch(Generic[TVar, TVal]):
+    """
+    Runs the deduction first and only starts a backtracking search if variables are left undetermined.
+    Has the same result fields as BtSearch, count is 0 if the puzzle was solved by deduction alone
+    """
+
+    count : int
+    deduction_steps : int
+    result : CpsState[TVar, TVal] | None
+    status : str | None
+    elapsed : float
+
+    def __init__(self):
+        self.count = 0
+        self.deduction_steps = 0
+        self.result = None
+        self.status = None
+        self.elapsed = 0.0
+
+    @staticmethod
+    def search(tool : BtSearchTools, initialState : CpsState[TVar, TVal], limits : BtSearchLimits | None = None, transpositions : BtTranspositionTable[TVar, TVal] | None = None) -> 'DeductionBtSearch[TVar, TVal]':
+        instance = DeductionBtSearch()
+
+        config = initialState.get_configuration()
+        deduction = CpsDeduction(config, initialState.get_assignments())
+        consistent = deduction.run()
+        instance.deduction_steps = deduction.steps
+
+        if not consistent:
+            instance.status = BtSearchStatus.UNSAT
+            return instance
+
+        # start from the determined variables
+        initial = initialState.get_assignments()
+        state = initialState
+        for var, val in deduction.get_assignments().items():
+            if var not in initial:
+                state = state.assign(var, val)
+
+        if deduction.is_solved() and state.is_complete():
+            instance.result = state
+            instance.status = BtSearchStatus.SOLVED
+            return instance
+
+        search = BtSearch.search(DomainBtSearch(tool, deduction.domains), state, limits, transpositions)
+        instance.count = search.count
+        instance.result = search.result
+        instance.status = search.status
+        instance.elapsed = search.elapsed
+        return instance
+
+    def get_steps(self) -> int:
+        """
+        Deduction steps and search nodes together
+        """
+        return self.deduction_steps + self.count
+
+
+class DeductionStatistics:
+    """
+    How many puzzles were solved without any search node
+    """
+    puzzles : int
+    zero_node : int
+    deduction_steps : int
+    nodes : int
+
+    def __init__(self):
+        self.puzzles = 0
+        self.zero_node = 0
+        self.deduction_steps = 0
+        self.nodes = 0
+
+    def record(self, search : DeductionBtSearch) -> None:
+        self.puzzles += 1
+        self.deduction_steps += search.deduction_steps
+        self.nodes += search.count
+
+        if search.result is not None and search.count == 0:
+            self.zero_node += 1
+
+    def __str__(self):
+        return f'Puzzles: {self.puzzles}, solved by deduction only: {self.zero_node}, deduction steps: {self.deduction_steps}, search nodes: {self.nodes}'
+
+    def __repr__(self):
+        return self.__str__()
@@ -0,0 +1,159 @@
+"""
+Multiple choice mode.
+The mc dataset asks many questions about the same puzzle. Each distinct puzzle is solved once,
+the solution is kept as lookup tables and every question is answered from them.
+"""
+
+from typing import *
+import re
+from collections import OrderedDict
+from puzzleSolver import solve_puzzle
+
+
+_HOUSE_QUESTION = re.compile(r'What is (.*?) of the person who lives in House (\d+)\?', re.IGNORECASE)
+
+
+class PzSolvedPuzzle:
+    """
+    Solved assignment of a puzzle, indexed by column (one column per characteristic of the grid header):
+    house -> column -> value and column -> value -> house.
+    Values are looked up lower case, the original spelling is kept for the answers
+    """
+    status : str
+    steps : int
+    columns : List[str]
+    house_of : Dict[str, Dict[str, int]]
+    attributes_of : Dict[int, Dict[str, str]]
+
+    def __init__(self, status : str, steps : int, grid_solution : Dict[str, Any] | None):
+        self.status = status
+        self.steps = steps
+        self.columns = []
+        self.house_of = {}
+        self.attributes_of = {}
+
+        if grid_solution is None:
+            return
+
+        self.columns = grid_solution["header"][1:]
+        for column in self.columns:
+            self.house_of[column] = {}
+
+        for row in grid_solution["rows"]:
+            house = int(row[0])
+            self.attributes_of[house] = dict(zip(self.columns, row[1:]))
+            for column, value in zip(self.columns, row[1:]):
+                self.house_of[column][value.lower()] = house
+
+    def is_solved(self) -> bool:
+        return len(self.attributes_of) > 0
+
+    def get_house(self, value : str, column : str | None = None) -> int | None:
+        """
+        House of a value. Without a column the value has to be unique over all columns
+        """
+        if column is not None:
+            return self.house_of.get(column, {}).get(value.lower())
+
+        houses = {houses[value.lower()] for houses in self.house_of.values() if value.lower() in houses}
+        if len(houses) != 1:
+            return None
+        return houses.pop()
+
+    def find_column(self, attribute : str, choices : Iterable[str]) -> str | None:
+        """
+        Column of an attribute as it is named in the questions (eg. "BookGenre" for "People have unique favorite book genres").
+        Columns are ranked by the words of the attribute found in the header, then by the number of choices that are values of the column
+        """
+        words = [w.lower() for w in re.findall(r'[A-Z]?[a-z]+|[A-Z]+(?![a-z])|\d+', attribute)]
+        choices = [c.lower() for c in choices]
+
+        best = None
+        best_score = (0, 0)
+        for column in self.columns:
+            header = column.lower()
+            score = (sum(1 for w in words if w in header), sum(1 for c in choices if c in self.house_of[column]))
+            if score > best_score:
+                best = column
+                best_score = score
+        return best
+
+    def answer(self, question : str, choices : Iterable[str]) -> str | None:
+        """
+        Pick the choice that matches the solution. None if the question can not be answered
+        """
+
+        match = _HOUSE_QUESTION.search(question)
+        if match is None:
+            return None
+
+        choices = list(choices)
+        attributes = self.attributes_of.get(int(match[2]))
+        column = self.find_column(match[1], choices)
+        if attributes is None or column is None:
+            return None
+
+        value = attributes[column].lower()
+        for choice in choices:
+            if choice.lower() == value:
+                return choice
+        return None
+
+
+class McStatistics:
+    questions : int
+    puzzles : int
+    answered : int
+
+    def __init__(self):
+        self.questions = 0
+        self.puzzles = 0
+        self.answered = 0
+
+    def __str__(self):
+        return f'Questions: {self.questions}, distinct puzzles: {self.puzzles}, answered: {self.answered}'
+
+    def __repr__(self):
+        return self.__str__()
+
+
+def group_by_puzzle(rows : Iterable[Mapping[str, Any]]) -> OrderedDict[str, List[Mapping[str, Any]]]:
+    """
+    Group question rows by their puzzle text, keeping the order of first appearance
+    """
+    groups = OrderedDict()
+    for row in rows:
+        puzzle = row["puzzle"]
+        if puzzle not in groups:
+            groups[puzzle] = []
+        groups[puzzle].append(row)
+    return groups
+
+
+def answer_mc_questions(rows : Iterable[Mapping[str, Any]], timeout : float | None = None, statistics : McStatistics | None = None) -> Iterator[tuple[Mapping[str, Any], str | None]]:
+    """
+    Answer all question rows (puzzle, question, choices).
+    Each distinct puzzle is solved once, so the cost depends on the number of puzzles and not on the number of questions.
+    Yields (row, answer) grouped by puzzle
+    """
+
+    for puzzle, questions in group_by_puzzle(rows).items():
+
+        try:
+            result = solve_puzzle(puzzle, timeout=timeout)
+            solved = PzSolvedPuzzle(result["status"], result["steps"], result["grid_solution"])
+        except Exception:
+            solved = PzSolvedPuzzle("error", 0, None)
+
+        if statistics is not None:
+            statistics.puzzles += 1
+
+        for row in questions:
+            answer = solved.answer(row["question"], row["choices"]) if solved.is_solved() else None
+
+            if statistics is not None:
+                statistics.questions += 1
+                if answer is not None:
+                    statistics.answered += 1
+
+            yield row, answer
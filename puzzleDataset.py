@@ -0,0 +1,135 @@
+"""
+Streaming readers for the puzzle datasets.
+Only local files are read. Rows are produced batch by batch, so the memory use does not grow with the dataset size.
+"""
+
+from typing import *
+import csv
+import itertools
+import json
+import os
+
+
+PUZZLE_COLUMNS = ["id", "size", "puzzle", "solution"]
+
+
+class PzRecord:
+    """
+    A single puzzle of a dataset. The solution is only set if the dataset contains it
+    """
+    __slots__ = ["id", "size", "puzzle", "solution"]
+
+    id : str
+    size : str | None
+    puzzle : str
+    solution : Dict[str, Any] | None
+
+    def __init__(self, id : str, size : str | None, puzzle : str, solution : Dict[str, Any] | None = None):
+        self.id = id
+        self.size = size
+        self.puzzle = puzzle
+        self.solution = solution
+
+    def get_size(self) -> tuple[int, int] | None:
+        """
+        Number of houses and attributes (eg. '5*6' -> (5, 6))
+        """
+        if self.size is None:
+            return None
+        houses, attributes = self.size.split('*')
+        return int(houses), int(attributes)
+
+    def __str__(self):
+        return f'{self.id} ({self.size})'
+
+    def __repr__(self):
+        return self.__str__()
+
+
+def _ensure_local(path : str) -> None:
+    if "://" in path:
+        raise Exception(f"Only local dataset files are supported: '{path}'")
+    if not os.path.isfile(path):
+        raise Exception(f"Dataset file not found: '{path}'")
+
+
+def iter_parquet_rows(path : str, columns : List[str] | None = None, batch_size : int = 256) -> Iterator[Dict[str, Any]]:
+    """
+    Stream the rows of a parquet file as dictionaries, reading one arrow record batch at a time.
+    Columns that are requested but not in the file are skipped
+    """
+    _ensure_local(path)
+
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise Exception("Reading parquet datasets requires pyarrow")
+
+    parquet_file = pq.ParquetFile(path)
+
+    if columns is not None:
+        available = parquet_file.schema_arrow.names
+        columns = [c for c in columns if c in available]
+
+    for batch in parquet_file.iter_batches(batch_size=batch_size, columns=columns):
+        for row in batch.to_pylist():
+            yield row
+
+
+def iter_csv_rows(path : str, chunk_size : int = 256) -> Iterator[Dict[str, Any]]:
+    """
+    Stream the rows of a csv file as dictionaries, reading chunk_size rows at a time.
+    Puzzle texts contain line breaks inside quoted fields, so the file is parsed with the csv module and not line by line
+    """
+    _ensure_local(path)
+
+    with open(path, newline="", encoding="utf-8") as f:
+        reader = csv.DictReader(f)
+
+        while True:
+            chunk = list(itertools.islice(reader, chunk_size))
+            if len(chunk) == 0:
+                break
+
+            for row in chunk:
+                yield row
+
+
+def iter_rows(path : str, columns : List[str] | None = None, batch_size : int = 256) -> Iterator[Dict[str, Any]]:
+    """
+    Stream rows of a parquet or csv dataset
+    """
+    if path.endswith(".parquet"):
+        return iter_parquet_rows(path, columns, batch_size)
+
+    if path.endswith(".csv"):
+        rows = iter_csv_rows(path, batch_size)
+        if columns is None:
+            return rows
+        return ({c: row[c] for c in columns if c in row} for row in rows)
+
+    raise Exception(f"Unsupported dataset format: '{path}', allowed: .parquet, .csv")
+
+
+def _decode_solution(solution : Dict[str, Any] | str | None) -> Dict[str, Any] | None:
+    """
+    Csv files contain the solution as JSON text, parquet files already as dictionary.
+    An empty or masked (not decodable) solution is None
+    """
+    if not isinstance(solution, str):
+        return solution
+
+    try:
+        decoded = json.loads(solution)
+    except json.JSONDecodeError:
+        return None
+
+    return decoded if isinstance(decoded, dict) else None
+
+
+def iter_puzzles(path : str, batch_size : int = 256) -> Iterator[PzRecord]:
+    """
+    Stream the puzzles (id, size, puzzle and the solution if present) of a dataset
+    """
+    for row in iter_rows(path, PUZZLE_COLUMNS, batch_size):
+        yield PzRecord(row["id"], row.get("size"), row["puzzle"], _decode_solution(row.get("solution")))
@@ -1,5 +1,5 @@
-import pandas as pd
 import re
+from functools import lru_cache
 from typing import *
 
 
@@ -128,14 +128,22 @@ class PzClue:
         return self.__str__()
     
 
+@lru_cache(maxsize=8192)
+def compile_pattern(pattern : str) -> re.Pattern:
+    """
+    Compiled, case insensitive pattern. 
+    Each clue template is instantiated for every variable combination, which overflows the small cache of the re module
+    """
+    return re.compile(pattern, re.IGNORECASE)
+
 def check_for_clue(var1, var2, regex, text):
     
     sa = regex.replace("%1", var1).replace("%2", var2)
-    if re.search(sa, text, re.IGNORECASE):
+    if compile_pattern(sa).search(text):
         return True
     
     sb = regex.replace("%1", var2).replace("%2", var1)
-    if re.search(sb, text, re.IGNORECASE):
+    if compile_pattern(sb).search(text):
         return True
     
     return False
@@ -143,7 +151,7 @@ def check_for_clue(var1, var2, regex, text):
 def check_for_single_clue(var1, regex, text):
     
     sa = regex.replace("%1", var1)
-    if re.search(sa, text, re.IGNORECASE):
+    if compile_pattern(sa).search(text):
         return True
     
     return False
@@ -224,7 +232,7 @@ def analyze_clues(variables: List[PzVariableGroup], raw_clues : List[str]) -> Li
         vars = []
         test_clue = c
         for var in all_variables:
-            if re.search(var, test_clue, re.IGNORECASE):
+            if compile_pattern(var).search(test_clue):
                 vars.append(var)
                 # test_clue = test_clue.replace(var, "")
                 test_clue = re.sub(re.escape(var), '', test_clue, flags=re.IGNORECASE)
@@ -0,0 +1,255 @@
+from typing import *
+from collections import OrderedDict
+from cps import *
+from bt_search import *
+from cps_deduction import DeductionBtSearch
+from puzzleParser import *
+from puzzleParser import analyze_puzzle_text
+
+
+##### Clue relations
+# The expressions are inlined by the compiled consistency checks (see cps_compile)
+
+@cps_expression("{a} == {b} - 1 or {a} == {b} + 1")
+def next_door(a, b):
+    return a == b - 1 or a == b + 1
+
+@cps_expression("{b} + 1 == {a}")
+def right_next_to(a, b):
+    return (b + 1) == a
+
+@cps_expression("{a} + 1 == {b}")
+def direct_left_of(a, b):
+    return (a + 1) == b
+
+@cps_expression("{a} - 1 == {b}")
+def direct_right_of(a, b):
+    return (a - 1) == b
+
+@cps_expression("{a} < {b}")
+def left_of(a, b):
+    return a < b
+
+@cps_expression("{a} > {b}")
+def right_of(a, b):
+    return a > b
+
+@cps_expression("{a} + 2 == {b} or {a} - 2 == {b}")
+def one_between(a, b):
+    return (a + 2) == b or (a - 2) == b
+
+@cps_expression("{a} + 3 == {b} or {a} - 3 == {b}")
+def two_between(a, b):
+    return (a + 3) == b or (a - 3) == b
+
+
+##### Configuration
+
+def add_clue(config : CpsConfiguration[str, int], clue : PzClue) -> CpsConstraintHandle[str, int]:
+    """
+    Add the constraint implied by a clue. The returned handle can be used to retract it again
+    """
+    if clue.function == "equal":
+        return config.equal(clue.variables[0], clue.variables[1])
+    elif clue.function == "notEqual":
+        return config.notEqual(clue.variables[0], clue.variables[1])
+    elif clue.function == "dLeftOf":
+        return config.addConstraintRev(clue.variables[0], clue.variables[1], direct_left_of)
+    elif clue.function == "dRightOf":
+        return config.addConstraintRev(clue.variables[0], clue.variables[1], direct_right_of)
+    elif clue.function == "leftOf":
+        return config.addConstraintRev(clue.variables[0], clue.variables[1], left_of)
+    elif clue.function == "rightOf":
+        return config.addConstraintRev(clue.variables[0], clue.variables[1], right_of)
+    elif clue.function == "nextTo":
+        return config.addConstraintRev(clue.variables[0], clue.variables[1], next_door)
+    elif clue.function == "oneBetween":
+        return config.addConstraintRev(clue.variables[0], clue.variables[1], one_between)
+    elif clue.function == "twoBetween":
+        return config.addConstraintRev(clue.variables[0], clue.variables[1], two_between)
+
+    elif clue.function == "not1":
+        return config.mustNotBe(clue.variables[0], 1)
+    elif clue.function == "not2":
+        return config.mustNotBe(clue.variables[0], 2)
+    elif clue.function == "not3":
+        return config.mustNotBe(clue.variables[0], 3)
+    elif clue.function == "not4":
+        return config.mustNotBe(clue.variables[0], 4)
+    elif clue.function == "not5":
+        return config.mustNotBe(clue.variables[0], 5)
+    elif clue.function == "not6":
+        return config.mustNotBe(clue.variables[0], 6)
+
+    elif clue.function == "is1":
+        return config.mustBe(clue.variables[0], 1)
+    elif clue.function == "is2":
+        return config.mustBe(clue.variables[0], 2)
+    elif clue.function == "is3":
+        return config.mustBe(clue.variables[0], 3)
+    elif clue.function == "is4":
+        return config.mustBe(clue.variables[0], 4)
+    elif clue.function == "is5":
+        return config.mustBe(clue.variables[0], 5)
+    elif clue.function == "is6":
+        return config.mustBe(clue.variables[0], 6)
+    else:
+        raise Exception(f'Function not implemented: "{clue.function}"')
+
+
+def configure_cps(puzzle: PzPuzzleDefinition) -> CpsConfiguration[str, int]:
+    if not puzzle.is_valid():
+        raise Exception("Can not generate cps for invalid puzzle definition")
+
+    variables = []
+    for g in puzzle.variables:
+        for v in g.variables:
+            variables.append(v.name)
+
+    values = list(range(1, puzzle.house_count + 1))
+
+    config = CpsConfiguration[str, int](variables, values)
+
+    for g in puzzle.variables:
+        config.allNotEqual(list(map(lambda a: a.name, g.variables)))
+
+    for c in puzzle.clues:
+        add_clue(config, c)
+
+    return config
+
+
+# Recently compiled puzzles. The configuration is never modified by a search, so it can be reused (including its compiled checks)
+_model_cache : OrderedDict[str, tuple[PzPuzzleDefinition, CpsConfiguration[str, int]]] = OrderedDict()
+MODEL_CACHE_SIZE = 256
+
+
+def get_puzzle_model(puzzle_text : str) -> tuple[PzPuzzleDefinition, CpsConfiguration[str, int] | None]:
+    """
+    Parse and configure a puzzle, or take it from the cache of recently used puzzles.
+    The configuration is None if the puzzle could not be parsed completely
+    """
+
+    if puzzle_text in _model_cache:
+        _model_cache.move_to_end(puzzle_text)
+        return _model_cache[puzzle_text]
+
+    definition = analyze_puzzle_text(puzzle_text)
+    config = None
+    if definition.is_valid():
+        config = configure_cps(definition)
+        config.compile()
+
+    _model_cache[puzzle_text] = (definition, config)
+    if len(_model_cache) > MODEL_CACHE_SIZE:
+        _model_cache.popitem(last=False)
+
+    return definition, config
+
+
+##### Solution
+
+def solution_value_name(variable : str) -> str:
+    """
+    Remove the prefix the parser adds to disambiguate some variables (eg. 'f.red')
+    """
+    if variable.startswith('f.') or variable.startswith('h.') or variable.startswith('c.'):
+        return variable[2:]
+    return variable
+
+
+def get_variable_groups(puzzle_definition : PzPuzzleDefinition) -> Dict[str, int]:
+    """
+    Map each variable name to the index of its variable group
+    """
+    groups = {}
+    for index, g in enumerate(puzzle_definition.variables):
+        for v in g.variables:
+            groups[v.name] = index
+    return groups
+
+
+def build_grid_solution(puzzle_definition : PzPuzzleDefinition, assignments : Dict[str, int], header : List[str] | None = None):
+    """
+    Build the solution dictionary ({"header", "rows"}) from a complete assignment.
+    The assignment is inverted in a single pass, each variable is written directly into its house row and group column
+    """
+
+    groups = get_variable_groups(puzzle_definition)
+
+    calculated_rows = []
+    for house in range(1, puzzle_definition.house_count + 1):
+        row = [None] * (len(puzzle_definition.variables) + 1)
+        row[0] = str(house)
+        calculated_rows.append(row)
+
+    for variable, house in assignments.items():
+        calculated_rows[house - 1][groups[variable] + 1] = solution_value_name(variable)
+
+    for row in calculated_rows:
+        if None in row:
+            raise Exception("Incomplete assignment, missing value in row ", row)
+
+    if header is None:
+        header = ["House"]
+        header += map(lambda x: str(x.name), puzzle_definition.variables)
+
+    return {
+        "header" : header,
+        "rows": calculated_rows
+    }
+
+
+def build_puzzle_solution(puzzle_definition : PzPuzzleDefinition, result : CpsState[str, int], header : List[str] | None = None):
+    """
+    Takes a puzzle definition and a cps result and builds the solution dictionary
+    """
+    return build_grid_solution(puzzle_definition, result.get_assignments(), header)
+
+
+def puzzle_solution_to_str(solution) -> str:
+
+    d = []
+
+    header = map(lambda x: "\"" + x +"\"" ,solution["header"])
+    d.append(f'"header": [{", ".join(header)}]')
+
+    rows = []
+    for r in solution["rows"]:
+        row = map(lambda x: "\"" + str(x) +"\"" , r)
+        rows.append("[" + ", ".join(row) + "]")
+
+    d.append(f'"rows": [{", ".join(rows)}]')
+
+    return '{' + ", ".join(d)  + '}'
+
+
+##### Solving
+
+def solve_puzzle(puzzle_text : str, header : List[str] | None = None, timeout : float | None = None) -> Dict[str, Any]:
+    """
+    Solve a puzzle given as text.
+    Returns a plain dictionary (grid_solution, steps, status, nodes, deduction_steps) so it can be sent between processes.
+    The puzzle is solved by deduction first, steps counts both the deduction steps and the search nodes
+    """
+
+    definition, config = get_puzzle_model(puzzle_text)
+
+    if config is None:
+        return { "grid_solution": None, "steps": 0, "status": "invalid", "nodes": 0, "deduction_steps": 0 }
+
+    # every level assigns one variable, a deeper search can not end (eg. a variable name used in two groups)
+    limits = BtSearchLimits(timeout=timeout, max_depth=len(config.variables()))
+    result = DeductionBtSearch.search(MrvBtSearch(), CpsState(config), limits)
+
+    grid_solution = None
+    if result.result is not None:
+        grid_solution = build_puzzle_solution(definition, result.result, header)
+
+    return {
+        "grid_solution": grid_solution,
+        "steps": result.get_steps(),
+        "status": result.status,
+        "nodes": result.count,
+        "deduction_steps": result.deduction_steps,
+    }
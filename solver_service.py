@@ -0,0 +1,252 @@
+"""
+Long running solver process.
+
+Reads one JSON request per line and streams back one JSON response per line.
+    request:  {"id": "...", "puzzle": "...", "header": [...] (optional)}
+    response: {"id": "...", "grid_solution": "...", "steps": 12, "status": "solved", "latency": 0.01}
+
+    request:  {"command": "stats"}
+    response: {"stats": {...}}
+
+Requests are handled concurrently, responses are written as soon as they are ready (not in request order).
+Every worker process keeps its own compiled clue patterns and recently used puzzle models (see puzzleSolver.get_puzzle_model).
+"""
+
+from typing import *
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from puzzleSolver import solve_puzzle, puzzle_solution_to_str
+
+
+class SolverStatistics:
+    """
+    Throughput and latency counters of the service
+    """
+    started : float
+    requests : int
+    solved : int
+    failed : int
+    errors : int
+    zero_node : int
+    total_latency : float
+    max_latency : float
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.requests = 0
+        self.solved = 0
+        self.failed = 0
+        self.errors = 0
+        self.zero_node = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    def record(self, latency : float, status : str, nodes : int = 0) -> None:
+        if status == "solved":
+            self.solved += 1
+            if nodes == 0:
+                # solved by deduction alone
+                self.zero_node += 1
+        elif status == "error":
+            self.errors += 1
+        else:
+            self.failed += 1
+
+        self.total_latency += latency
+        self.max_latency = max(self.max_latency, latency)
+
+    def snapshot(self) -> Dict[str, Any]:
+        uptime = time.monotonic() - self.started
+        completed = self.solved + self.failed + self.errors
+
+        return {
+            "uptime": uptime,
+            "requests": self.requests,
+            "completed": completed,
+            "in_flight": self.requests - completed,
+            "solved": self.solved,
+            "failed": self.failed,
+            "errors": self.errors,
+            "zero_node": self.zero_node,
+            "throughput": completed / uptime if uptime > 0 else 0.0,
+            "mean_latency": self.total_latency / completed if completed > 0 else 0.0,
+            "max_latency": self.max_latency,
+        }
+
+
+class SolverService:
+    """
+    Asyncio front end in front of a process pool
+    """
+    _executor : ProcessPoolExecutor
+    _timeout : float | None
+    _in_flight : asyncio.Semaphore
+
+    statistics : SolverStatistics
+
+    def __init__(self, workers : int | None = None, timeout : float | None = None, max_in_flight : int | None = None):
+        if workers is None:
+            workers = os.cpu_count() or 1
+        if max_in_flight is None:
+            max_in_flight = 4 * workers
+
+        # spawn instead of fork: forked workers would inherit (and keep open) the client sockets
+        self._executor = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"))
+        self._timeout = timeout
+        # requests being solved, reading more lines waits until one is done
+        self._in_flight = asyncio.Semaphore(max_in_flight)
+        self.statistics = SolverStatistics()
+
+    def close(self) -> None:
+        self._executor.shutdown(cancel_futures=True)
+
+
+    async def handle(self, line : str) -> Dict[str, Any]:
+        """
+        Handle a single request line and build the response
+        """
+
+        try:
+            request = json.loads(line)
+        except json.JSONDecodeError as ex:
+            return { "error": f"Invalid request: {ex}" }
+
+        if not isinstance(request, dict):
+            return { "error": "Invalid request: expected a JSON object" }
+
+        if request.get("command") == "stats":
+            return { "stats": self.statistics.snapshot() }
+
+        if "puzzle" not in request:
+            return { "id": request.get("id"), "error": "Request has no puzzle" }
+
+        self.statistics.requests += 1
+        start = time.monotonic()
+
+        loop = asyncio.get_running_loop()
+        try:
+            result = await loop.run_in_executor(self._executor, solve_puzzle, request["puzzle"], request.get("header"), self._timeout)
+        except Exception as ex:
+            latency = time.monotonic() - start
+            self.statistics.record(latency, "error")
+            return { "id": request.get("id"), "error": str(ex), "latency": latency }
+
+        latency = time.monotonic() - start
+        self.statistics.record(latency, result["status"], result["nodes"])
+
+        grid_solution = None
+        if result["grid_solution"] is not None:
+            grid_solution = puzzle_solution_to_str(result["grid_solution"])
+
+        return {
+            "id": request.get("id"),
+            "grid_solution": grid_solution,
+            "steps": result["steps"],
+            "status": result["status"],
+            "latency": latency,
+        }
+
+
+    async def serve(self, readline : Callable[[], Awaitable[bytes]], write : Callable[[str], Awaitable[None]]) -> None:
+        """
+        Read requests until EOF, answer each one as soon as it is solved
+        """
+
+        pending = set()
+
+        async def respond(line : str):
+            try:
+                response = await self.handle(line)
+                await write(json.dumps(response) + "\n")
+            finally:
+                self._in_flight.release()
+
+        while True:
+            line = await readline()
+            if not line:
+                break
+
+            line = line.decode().strip()
+            if len(line) == 0:
+                continue
+
+            await self._in_flight.acquire()
+            task = asyncio.create_task(respond(line))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+
+        if len(pending) > 0:
+            await asyncio.gather(*pending)
+
+
+    async def serve_stdio(self) -> None:
+        loop = asyncio.get_running_loop()
+
+        # stdin may be a file, a pipe or a terminal, reading it in a thread works for all of them
+        def readline():
+            return loop.run_in_executor(None, sys.stdin.buffer.readline)
+
+        async def write(text : str):
+            sys.stdout.write(text)
+            sys.stdout.flush()
+
+        await self.serve(readline, write)
+
+
+    async def serve_socket(self, path : str | None = None, port : int | None = None) -> None:
+        """
+        Serve on a local unix socket (path) or on a localhost tcp port
+        """
+
+        async def client(reader : asyncio.StreamReader, writer : asyncio.StreamWriter):
+            lock = asyncio.Lock()
+
+            async def write(text : str):
+                async with lock:
+                    writer.write(text.encode())
+                    await writer.drain()
+
+            try:
+                await self.serve(reader.readline, write)
+            finally:
+                writer.close()
+
+        if path is not None:
+            if os.path.exists(path):
+                os.remove(path)
+            server = await asyncio.start_unix_server(client, path, limit=2 ** 24)
+        else:
+            server = await asyncio.start_server(client, "127.0.0.1", port, limit=2 ** 24)
+
+        async with server:
+            await server.serve_forever()
+
+
+def main(argv : List[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Long running JSONL puzzle solver")
+    parser.add_argument("--socket", help="listen on this unix socket instead of stdin/stdout")
+    parser.add_argument("--port", type=int, help="listen on this localhost tcp port instead of stdin/stdout")
+    parser.add_argument("--workers", type=int, default=None, help="number of solver processes")
+    parser.add_argument("--timeout", type=float, default=None, help="search time limit per puzzle in seconds")
+    parser.add_argument("--max-in-flight", type=int, default=None, help="requests solved at the same time before reading waits (default 4 * workers)")
+    args = parser.parse_args(argv)
+
+    service = SolverService(args.workers, args.timeout, args.max_in_flight)
+    try:
+        if args.socket is not None or args.port is not None:
+            asyncio.run(service.serve_socket(args.socket, args.port))
+        else:
+            asyncio.run(service.serve_stdio())
+    finally:
+        service.close()
+        print(json.dumps({ "stats": service.statistics.snapshot() }), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
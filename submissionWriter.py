@@ -0,0 +1,120 @@
+from typing import *
+import csv
+from puzzleSolver import puzzle_solution_to_str
+
+
+class SubmissionWriter:
+    """
+    Buffered writer for submission files (id, grid_solution, steps).
+    Rows are collected and written in batches, either as csv or as parquet (needs pyarrow).
+
+    with SubmissionWriter("submission.csv") as writer:
+        writer.write(puzzle_id, solution, result.count)
+    """
+
+    COLUMNS = ["id", "grid_solution", "steps"]
+
+    _path : str
+    _format : str
+    _batch_size : int
+    _rows : List[tuple[str, str, int]]
+    _file = None
+    _csv_writer = None
+    _parquet_writer = None
+
+    count : int
+
+    def __init__(self, path : str, format : str | None = None, batch_size : int = 1000):
+        if format is None:
+            format = "parquet" if path.endswith(".parquet") else "csv"
+
+        if format not in ["csv", "parquet"]:
+            raise Exception(f"Unsupported submission format: '{format}', allowed: csv, parquet")
+
+        self._path = path
+        self._format = format
+        self._batch_size = batch_size
+        self._rows = []
+        self.count = 0
+
+    def __enter__(self) -> 'SubmissionWriter':
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+
+    def write(self, puzzle_id : str, grid_solution : Dict[str, Any] | str | None, steps : int) -> None:
+        """
+        Add a row. The solution can be given as dictionary ({"header", "rows"}), as already encoded string or None if unsolved
+        """
+
+        if grid_solution is None:
+            grid_solution = ""
+        elif not isinstance(grid_solution, str):
+            # same text as the other submission files (non ascii characters as they are)
+            grid_solution = puzzle_solution_to_str(grid_solution)
+
+        self._rows.append((puzzle_id, grid_solution, steps))
+        self.count += 1
+
+        if len(self._rows) >= self._batch_size:
+            self.flush()
+
+
+    def flush(self) -> None:
+        if len(self._rows) == 0:
+            return
+
+        if self._format == "csv":
+            self._flush_csv()
+        else:
+            self._flush_parquet()
+
+        self._rows = []
+
+
+    def close(self) -> None:
+        self.flush()
+
+        if self._file is None and self._parquet_writer is None:
+            # nothing was written, still create the file with its header
+            if self._format == "csv":
+                self._flush_csv()
+            else:
+                self._flush_parquet()
+
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+            self._parquet_writer = None
+
+
+    def _flush_csv(self) -> None:
+        if self._file is None:
+            self._file = open(self._path, "w", newline="", encoding="utf-8", buffering=1 << 20)
+            self._csv_writer = csv.writer(self._file)
+            self._csv_writer.writerow(self.COLUMNS)
+
+        self._csv_writer.writerows(self._rows)
+
+
+    def _flush_parquet(self) -> None:
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise Exception("Writing parquet submissions requires pyarrow")
+
+        schema = pa.schema([("id", pa.string()), ("grid_solution", pa.string()), ("steps", pa.int64())])
+
+        if self._parquet_writer is None:
+            self._parquet_writer = pq.ParquetWriter(self._path, schema)
+
+        # every batch becomes one row group
+        columns = list(zip(*self._rows)) if len(self._rows) > 0 else [[], [], []]
+        table = pa.Table.from_arrays([pa.array(c, type=f.type) for c, f in zip(columns, schema)], schema=schema)
+        self._parquet_writer.write_table(table)